@@ -70,6 +70,10 @@ parser.add_option(
   "-d", "--dump", dest="dump", action="store_true",
   help="Dumps all discovered entries to standard output, e.g. for debugging",
 )
+parser.add_option(
+  "-l", "--live-resolver", dest="live_resolver",
+  help="Also check the A/AAAA/PTR answers given by the recursive resolver at this IP address against the zone data",
+)
 
 (options, args) = parser.parse_args()
 
@@ -201,3 +205,8 @@ if options.dump:
 print "Checking for problems..."
 for aaagh in checker.findProblems():
     print aaagh
+
+if options.live_resolver:
+    print "Checking live answers from %s..." % options.live_resolver
+    for aaagh in checker.verifyLive(options.live_resolver):
+        print aaagh
@@ -25,13 +25,30 @@ THE SOFTWARE.
 """
 
 import re
+import time
+import Queue
 import cPickle
+import threading
 import dns
-from dns         import resolver, query, zone
+from dns         import resolver, query, zone, reversename, exception
 from IPy         import IP
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime    import datetime
 
+# Maps of key -> [value list], stored internally as key -> ordered set of
+# values so that checking for and removing a single value is cheap
+LIST_MAPS = [
+    'a_record_to_ip_map',
+    'ip_to_a_record_map',
+    'aaaa_record_to_ip_map',
+    'ip_to_aaaa_record_map',
+    'reverse_cname_map',
+    'ptr_record_to_name_map',
+    'name_to_ptr_record_map',
+    'name_to_all_ip_map',
+    'ip_to_all_names_map',
+]
+
 class Domainalyzer:
     """
     This class is used to load, parse and analyse one or more DNS zones
@@ -39,45 +56,68 @@ class Domainalyzer:
     be of much use).
     """
     
-    ## Forward and reverse IP-based records from DNS
+    def __init__(self, server=None, domains=None, rzones=None):
+        """
+        Initialises, optionally with lists of forward and reverse zones.
+        """
+
+        # Every instance gets its own maps - they mustn't be shared between
+        # objects, or removing a zone from one would remove it from all.
+        # The [list] maps are really key -> OrderedDict of value -> True, which
+        # iterate like lists but let us add and remove values in constant time.
+        # Lookups and pickles convert them back to plain lists.
 
-    # Map of A record -> [IP list] from DNS
-    a_record_to_ip_map = defaultdict(list)
-    ip_to_a_record_map = defaultdict(list)
+        ## Forward and reverse IP-based records from DNS
 
-    # The same for AAAAs
-    aaaa_record_to_ip_map = defaultdict(list)
-    ip_to_aaaa_record_map = defaultdict(list)
+        # Map of A record -> [IP list] from DNS
+        self.a_record_to_ip_map = defaultdict(OrderedDict)
+        self.ip_to_a_record_map = defaultdict(OrderedDict)
 
-    # Map of PTR IP -> [name list] from DNS (v4 and v6)
-    ptr_record_to_name_map = defaultdict(list)
-    name_to_ptr_record_map = defaultdict(list)
+        # The same for AAAAs
+        self.aaaa_record_to_ip_map = defaultdict(OrderedDict)
+        self.ip_to_aaaa_record_map = defaultdict(OrderedDict)
 
-    ## Forward and reverse CNAME records from DNS (aliases)
+        # Map of PTR IP -> [name list] from DNS (v4 and v6)
+        self.ptr_record_to_name_map = defaultdict(OrderedDict)
+        self.name_to_ptr_record_map = defaultdict(OrderedDict)
 
-    # Map of CNAME -> name from DNS
-    forward_cname_map = defaultdict(list)
-    reverse_cname_map = defaultdict(list)
+        ## Forward and reverse CNAME records from DNS (aliases)
 
+        # Map of CNAME -> name from DNS
+        self.forward_cname_map = defaultdict(list)
+        self.reverse_cname_map = defaultdict(OrderedDict)
 
-    ## Generated forward and reverse entries ignoring the source record type
 
-    # Reverse map of IP -> [list of names] built from CNAMES, As and AAAAs
-    ip_to_all_names_map = defaultdict(list)
+        ## Generated forward and reverse entries ignoring the source record type
 
-    # Map of hostname (from any source record) -> [IP list]
-    name_to_all_ip_map = defaultdict(list)
+        # Reverse map of IP -> [list of names] built from CNAMES, As and AAAAs
+        self.ip_to_all_names_map = defaultdict(OrderedDict)
 
-    # Date/time at which the DNS info was processed
-    processed_at = None
+        # Map of hostname (from any source record) -> [IP list]
+        self.name_to_all_ip_map = defaultdict(OrderedDict)
+
+        # Date/time at which the DNS info was processed
+        self.processed_at = None
  
-    # List of the domain names we actually know about
-    known_domains = []
+        # List of the domain names we actually know about
+        self.known_domains = []
 
-    def __init__(self, server=None, domains=None, rzones=None):
-        """
-        Initialises, optionally with lists of forward and reverse zones.
-        """
+
+        ## Per-zone provenance, so that zones can be removed or replaced
+
+        # Map of zone name -> set of (map name, key, value) entries it contributed
+        self.zone_entries = defaultdict(set)
+
+        # Map of (map name, key, value) -> number of contributors of that entry
+        self.entry_refcounts = defaultdict(int)
+
+        # Map of (CNAME, target name) -> set of the target's IPs, i.e. which
+        # general name/IP entries exist only because of that CNAME
+        self.cname_links = defaultdict(set)
+
+        # Map of CNAME -> ordered set of every target a zone gives it, so that
+        # if two zones disagree and one goes, the other's target is restored
+        self.forward_cname_targets = defaultdict(OrderedDict)
 
         if server:
             print "Loading from %s" % server
@@ -92,8 +132,13 @@ class Domainalyzer:
         """
         Requests zone transfer(s) from the specified DNS server of every forward
         zone we're interested in, and builds internal mapping tables. 
+        Any zone we already know about is replaced by the newly transferred copy.
+        Returns the list of zones that were transferred successfully.
         """
 
+        self._check_provenance()
+        loaded = []
+
         # Build mappings for the forward DNS zones
         for domain_name in domains:
             print "Transferring %s" %domain_name
@@ -106,66 +151,251 @@ class Domainalyzer:
                 print "Failed to load "+domain_name+": "+str(sys.exc_info())
 
                 continue
+
+            # Only throw away the old copy once we've got a new one
+            self.remove_zone(domain_name)
             self._map_forward_zone(zone, domain_name)
+            loaded.append(domain_name)
         
         self.processed_at = datetime.now()
+        return loaded
         
     def add_reverse_zones(self, server, rzones):
         """
         Requests zone transfer(s) from the specified DNS server of every
         reverse zone we're interested in, and builds internal mapping tables. 
+        Any zone we already know about is replaced by the newly transferred copy.
+        Returns the list of zones that were transferred successfully.
         """
 
+        self._check_provenance()
+        loaded = []
+
         # Build mappings for the reverse DNS zones
         for rzone_name in rzones:
 
             # We need to know if it's an IPv6 zone or not for building the mappings later
-            is_v6 = False
+            (is_v6, ip_prefix) = self._parse_reverse_zone_name(rzone_name)
 
-            # IPv4 reverse zones are e.g. 23.168.192.IN-ADDR.ARPA for the 192.168.23.* range
-            # Get the IP address parts and reverse them to get the IP prefix
-            if(re.search(r'\.IN-ADDR\.ARPA', rzone_name)):
+            try:
+                query = dns.query.xfr(server, rzone_name)
+                rzone = dns.zone.from_xfr(query, relativize=False)
+            except:
+                #print "Failed to process zone "+rzone_name
+                continue
 
-                # Convert "23.168.192.IN-ADDR.ARPA" to "23.168.192"
-                ip_prefix = re.sub(r'\.IN-ADDR\.ARPA', '', rzone_name)
+            # Now we've done all that hairy stuff, build the mappings
+            self.remove_zone(rzone_name)
+            self._map_reverse_zone(rzone, is_v6, ip_prefix, rzone_name)
+            loaded.append(rzone_name)
 
-                # Convert "23.168.192" to [23, 78, 152]
-                parts     = ip_prefix.split('.')
+        self.processed_at = datetime.now()
+        return loaded
 
-                # Convert to "192.168.23"
-                parts.reverse()
-                ip_prefix = '.'.join(parts)
+    def replace_zone(self, server, zone_name):
+        """
+        Re-transfers a single forward or reverse zone from the specified DNS
+        server and swaps it in place of our existing copy, leaving every
+        other zone's mappings untouched.  Returns True if the zone was
+        replaced, or False if the transfer failed and the old copy was kept.
+        """
 
+        if(re.search(r'\.IN-ADDR\.ARPA', zone_name) or re.search(r'\.IP6\.(ARPA|INT)', zone_name)):
+            loaded = self.add_reverse_zones(server, [zone_name])
+        else:
+            loaded = self.add_forward_zones(server, [zone_name])
 
-            # IPv6 reverse zones are e.g. 8.0.8.0.1.1.e.f.f.3.IP6.ARPA or deprecated .IP6.INT
-            # Get the IP address parts and reverse them to get the IP prefix, converting to colon-separated
-            elif(re.search(r'\.IP6\.(ARPA|INT)', rzone_name)):
+        return zone_name in loaded
 
-                is_v6 = True
+    def remove_zone(self, zone_name):
+        """
+        Removes everything a single forward or reverse zone contributed to
+        our internal mappings.  Entries that another zone also contributed
+        are kept.  Returns True if the zone was known, False otherwise.
+        """
 
-                # Convert "8.0.8.0.1.1.e.f.f.3.IP6.ARPA" to "8.0.8.0.1.1.e.f.f.3"
-                ip_prefix = re.sub(r'\.IP6\.(ARPA|INT)', '', rzone_name)
+        self._check_provenance()
 
-                # Reverse the string (we can do this as each part is a single character)
-                # Convert to "3.f.f.e.1.1.0.8.0.8"
-                ip_prefix = ip_prefix[::-1]
+        entries = self.zone_entries.pop(zone_name, None)
+        if entries is None:
+            return False
 
-                # Convert to "3ffe110808"
-                ip_prefix = re.sub(r'\.', '', ip_prefix)
+        for entry in entries:
+            self._drop_entry(entry)
 
+        if zone_name in self.known_domains:
+            self.known_domains.remove(zone_name)
 
-            try:
-                query = dns.query.xfr(server, rzone_name)
-                rzone = dns.zone.from_xfr(query, relativize=False)
-            except:
-                #print "Failed to process zone "+rzone_name
-                continue
+        self.processed_at = datetime.now()
+        return True
 
-            # Now we've done all that hairy stuff, build the mappings
-            self._map_reverse_zone(rzone, is_v6, ip_prefix)
+    def _parse_reverse_zone_name(self, rzone_name):
+        """
+        Works out whether a reverse zone is IPv4 or IPv6 from its name, and
+        the IP prefix it covers.  Returns a tuple of (is_v6, ip_prefix).
+        """
 
-        self.processed_at = datetime.now()
+        is_v6     = False
+        ip_prefix = None
+
+        # IPv4 reverse zones are e.g. 23.168.192.IN-ADDR.ARPA for the 192.168.23.* range
+        # Get the IP address parts and reverse them to get the IP prefix
+        if(re.search(r'\.IN-ADDR\.ARPA', rzone_name)):
+
+            # Convert "23.168.192.IN-ADDR.ARPA" to "23.168.192"
+            ip_prefix = re.sub(r'\.IN-ADDR\.ARPA', '', rzone_name)
+
+            # Convert "23.168.192" to [23, 78, 152]
+            parts     = ip_prefix.split('.')
 
+            # Convert to "192.168.23"
+            parts.reverse()
+            ip_prefix = '.'.join(parts)
+
+
+        # IPv6 reverse zones are e.g. 8.0.8.0.1.1.e.f.f.3.IP6.ARPA or deprecated .IP6.INT
+        # Get the IP address parts and reverse them to get the IP prefix, converting to colon-separated
+        elif(re.search(r'\.IP6\.(ARPA|INT)', rzone_name)):
+
+            is_v6 = True
+
+            # Convert "8.0.8.0.1.1.e.f.f.3.IP6.ARPA" to "8.0.8.0.1.1.e.f.f.3"
+            ip_prefix = re.sub(r'\.IP6\.(ARPA|INT)', '', rzone_name)
+
+            # Reverse the string (we can do this as each part is a single character)
+            # Convert to "3.f.f.e.1.1.0.8.0.8"
+            ip_prefix = ip_prefix[::-1]
+
+            # Convert to "3ffe110808"
+            ip_prefix = re.sub(r'\.', '', ip_prefix)
+
+        return (is_v6, ip_prefix)
+
+    def _check_provenance(self):
+        """
+        Makes sure we know which zone every entry came from before doing
+        anything zone-by-zone.
+        """
+
+        if self.zone_entries is None:
+            raise RuntimeError("Loaded from a pickle without per-zone tracking - "
+                               "zones can't be added, replaced or removed individually. "
+                               "Build a new Domainalyzer and transfer the zones again.")
+
+    def _add_entry(self, zone_name, map_name, key, value):
+        """
+        Records that a zone maps key -> value in the named map, adding the
+        value to the map only if nothing else has already done so.
+        """
+
+        entry = (map_name, key, value)
+
+        # The same zone can produce an entry more than once - only count it
+        # the first time
+        if entry in self.zone_entries[zone_name]:
+            return
+        self.zone_entries[zone_name].add(entry)
+
+        self._count_entry(entry)
+
+    def _count_entry(self, entry):
+        """
+        Adds one contribution of a (map name, key, value) entry, putting the
+        value in the map if it's the first.
+        """
+
+        (map_name, key, value) = entry
+
+        self.entry_refcounts[entry] += 1
+
+        # CNAMEs map to a single name rather than a list - the latest wins
+        if map_name == 'forward_cname_map':
+            self.forward_cname_map[key] = value
+            self.forward_cname_targets[key][value] = True
+            return
+
+        if self.entry_refcounts[entry] > 1:
+            return
+
+        getattr(self, map_name)[key][value] = True
+
+        # A new CNAME or A/AAAA record may complete a CNAME -> name -> IP
+        # chain, possibly with the other half coming from a different zone
+        if map_name == 'reverse_cname_map':
+            for ip in list(self.a_record_to_ip_map.get(key, [])) + list(self.aaaa_record_to_ip_map.get(key, [])):
+                self._link_cname(value, key, ip)
+
+        elif map_name in ('a_record_to_ip_map', 'aaaa_record_to_ip_map'):
+            for cname in self.reverse_cname_map.get(key, []):
+                self._link_cname(cname, key, value)
+
+    def _drop_entry(self, entry):
+        """
+        Forgets one contribution of a (map name, key, value) entry, removing
+        it from the map once nothing contributes it any more.
+        """
+
+        self.entry_refcounts[entry] -= 1
+        if self.entry_refcounts[entry] > 0:
+            return
+        del self.entry_refcounts[entry]
+
+        (map_name, key, value) = entry
+        mapping = getattr(self, map_name)
+
+        if map_name == 'forward_cname_map':
+            targets = self.forward_cname_targets[key]
+            del targets[value]
+
+            # Fall back to the latest target another zone still gives
+            if not targets:
+                del self.forward_cname_targets[key]
+                del mapping[key]
+            elif mapping.get(key) == value:
+                mapping[key] = next(reversed(targets))
+            return
+
+        values = mapping.get(key)
+        if values and value in values:
+            del values[value]
+            if not values:
+                del mapping[key]
+
+        # Losing either half of a CNAME -> name -> IP chain breaks it
+        if map_name == 'reverse_cname_map':
+            for ip in list(self.cname_links.get((value, key), [])):
+                self._unlink_cname(value, key, ip)
+
+        elif map_name in ('a_record_to_ip_map', 'aaaa_record_to_ip_map'):
+            for cname in self.reverse_cname_map.get(key, []):
+                if value in self.cname_links.get((cname, key), []):
+                    self._unlink_cname(cname, key, value)
+
+    def _link_cname(self, cname, name, ip):
+        """
+        Adds general name/IP entries for a CNAME whose target name has the
+        given IP.  These belong to neither zone on its own, so they're only
+        kept while both the CNAME and the A/AAAA record exist.
+        """
+
+        if ip in self.cname_links[(cname, name)]:
+            return
+        self.cname_links[(cname, name)].add(ip)
+
+        self._count_entry(('ip_to_all_names_map', ip, cname))
+        self._count_entry(('name_to_all_ip_map', cname, ip))
+
+    def _unlink_cname(self, cname, name, ip):
+        """
+        Removes the general name/IP entries added by _link_cname.
+        """
+
+        self.cname_links[(cname, name)].discard(ip)
+        if not self.cname_links[(cname, name)]:
+            del self.cname_links[(cname, name)]
+
+        self._drop_entry(('ip_to_all_names_map', ip, cname))
+        self._drop_entry(('name_to_all_ip_map', cname, ip))
 
 
 
@@ -177,13 +407,16 @@ class Domainalyzer:
         to names, mappings of CNAME -> name, and reverse mappings
         of name -> CNAME.
 
-        Maps the forward and reverse CNAME entries FIRST, so as it
-        goes along it can also add CNAME entries to the reverse IP maps.
-        This means we can end up with a mapping of
-        IP -> all hostnames that resolve to this IP.
+        Whenever a CNAME and the A/AAAA record it points at are both known
+        (from this zone or any other), the CNAME is also added to the
+        general name and IP maps.  This means we can end up with a mapping
+        of IP -> all hostnames that resolve to this IP.
         This is rather useful!
         """
 
+        # Make sure even a zone with no records is known, so it can be removed
+        self.zone_entries.setdefault(domain_name, set())
+
         # Map CNAME -> name and back
         for (name, ttl, rdata) in zone.iterate_rdatas('CNAME'):
 
@@ -191,8 +424,8 @@ class Domainalyzer:
             from_name = (str(name)+'.'+domain_name).lower()
             to_name   = (str(rdata.target)+'.'+domain_name).lower()
 
-            self.forward_cname_map[from_name] = to_name
-            self.reverse_cname_map[to_name].append(from_name)
+            self._add_entry(domain_name, 'forward_cname_map', from_name, to_name)
+            self._add_entry(domain_name, 'reverse_cname_map', to_name, from_name)
 
         # Build map of A => IP and back
         for (name, ttl, rdata) in zone.iterate_rdatas('A'):
@@ -201,18 +434,12 @@ class Domainalyzer:
             to_ip   = str(rdata.address)
 
             # Add to A record map
-            self.a_record_to_ip_map[from_name].append(to_ip)
-            self.ip_to_a_record_map[to_ip].append(from_name)
+            self._add_entry(domain_name, 'a_record_to_ip_map', from_name, to_ip)
+            self._add_entry(domain_name, 'ip_to_a_record_map', to_ip, from_name)
 
             # Add forward and reverse entries to general name and IP maps
-            self.ip_to_all_names_map[to_ip].append(from_name)
-            self.name_to_all_ip_map[from_name].append(to_ip)
-
-            # Loop over all the CNAMEs for this A record and
-            # add general forward/reverse entries
-            for cname in self.reverse_cname_map[from_name]:
-                self.ip_to_all_names_map[to_ip].append(cname)
-                self.name_to_all_ip_map[cname].append(to_ip)
+            self._add_entry(domain_name, 'ip_to_all_names_map', to_ip, from_name)
+            self._add_entry(domain_name, 'name_to_all_ip_map', from_name, to_ip)
 
 
         # Map AAAA -> IP
@@ -226,25 +453,25 @@ class Domainalyzer:
             to_ip     = str(IP(to_ip))
 
             # Add to AAAA record map
-            self.aaaa_record_to_ip_map[from_name].append(to_ip)
-            self.ip_to_aaaa_record_map[to_ip].append(from_name)
+            self._add_entry(domain_name, 'aaaa_record_to_ip_map', from_name, to_ip)
+            self._add_entry(domain_name, 'ip_to_aaaa_record_map', to_ip, from_name)
         
             # Add forward and reverse entries to general name and IP maps
-            self.ip_to_all_names_map[to_ip].append(from_name)
-            self.name_to_all_ip_map[from_name].append(to_ip)
+            self._add_entry(domain_name, 'ip_to_all_names_map', to_ip, from_name)
+            self._add_entry(domain_name, 'name_to_all_ip_map', from_name, to_ip)
 
-            for cname in self.reverse_cname_map[from_name]:
-                self.name_to_all_ip_map[cname].append(to_ip)
-                self.ip_to_all_names_map[to_ip].append(cname)
+        if domain_name not in self.known_domains:
+            self.known_domains.append(domain_name)
 
-        self.known_domains.append(domain_name)
-
-    def _map_reverse_zone(self, rzone, is_v6, ip_prefix):
+    def _map_reverse_zone(self, rzone, is_v6, ip_prefix, rzone_name):
         """
         Given a reverse DNS zone, build internal mappings of PTR records
         to IPv4/IPv6 addresses
         """
 
+        # Make sure even a zone with no records is known, so it can be removed
+        self.zone_entries.setdefault(rzone_name, set())
+
         for (name, ttl, rdata) in rzone.iterate_rdatas('PTR'):
             from_ip = str(name)
             to_name = re.sub(r'\.$', '', str(rdata.target).lower())
@@ -290,27 +517,37 @@ class Domainalyzer:
                     
 
             # Add the PTR mapping of IP -> [name list]
-            self.ptr_record_to_name_map[from_ip].append(to_name)
-            self.name_to_ptr_record_map[to_name].append(from_ip)
+            self._add_entry(rzone_name, 'ptr_record_to_name_map', from_ip, to_name)
+            self._add_entry(rzone_name, 'name_to_ptr_record_map', to_name, from_ip)
 
 
     def __getstate__(self):
         """
         For pickling purposes - returns a list of all the internal mappings we have built.
         """
+        lists = {}
+        for map_name in LIST_MAPS:
+            lists[map_name] = defaultdict(list)
+            for (key, values) in getattr(self, map_name).iteritems():
+                lists[map_name][key] = list(values)
+
         return [
-          self.a_record_to_ip_map,
-          self.ip_to_a_record_map,
-          self.aaaa_record_to_ip_map,
-          self.ip_to_aaaa_record_map,
+          lists['a_record_to_ip_map'],
+          lists['ip_to_a_record_map'],
+          lists['aaaa_record_to_ip_map'],
+          lists['ip_to_aaaa_record_map'],
           self.forward_cname_map,
-          self.reverse_cname_map,
-          self.ptr_record_to_name_map,
-          self.name_to_ptr_record_map,
-          self.name_to_all_ip_map,
-          self.ip_to_all_names_map,
+          lists['reverse_cname_map'],
+          lists['ptr_record_to_name_map'],
+          lists['name_to_ptr_record_map'],
+          lists['name_to_all_ip_map'],
+          lists['ip_to_all_names_map'],
           self.processed_at,
           self.known_domains,
+          self.zone_entries,
+          self.entry_refcounts,
+          self.cname_links,
+          self.forward_cname_targets,
         ]
 
     def __setstate__(self, state):
@@ -330,6 +567,27 @@ class Domainalyzer:
         self.processed_at           = state[10]
         self.known_domains          = state[11]
 
+        # Pickled maps hold plain lists - turn them back into ordered sets
+        for map_name in LIST_MAPS:
+            sets = defaultdict(OrderedDict)
+            for (key, values) in getattr(self, map_name).iteritems():
+                sets[key] = OrderedDict.fromkeys(values, True)
+            setattr(self, map_name, sets)
+
+        # Pickles from before per-zone tracking have no provenance data.
+        # They're fine for lookups, but adding, replacing or removing zones
+        # would duplicate or leave behind entries, so those raise an error
+        if len(state) > 12:
+            self.zone_entries          = state[12]
+            self.entry_refcounts       = state[13]
+            self.cname_links           = state[14]
+            self.forward_cname_targets = state[15]
+        else:
+            self.zone_entries          = None
+            self.entry_refcounts       = None
+            self.cname_links           = None
+            self.forward_cname_targets = None
+
     def findProblems(self):
         """
         Finds problems in the DNS records - specifically, missing PTR records and
@@ -367,6 +625,165 @@ class Domainalyzer:
 
         return problems
 
+    def verifyLive(self, nameserver=None, hostnames=None, ips=None, port=53,
+                   workers=20, rate=100, retries=2, timeout=2.0):
+        """
+        Checks what a recursive resolver actually answers for our records,
+        and returns a list of problems where the live A/AAAA/PTR answers
+        differ from the zone data.
+
+        Queries the given nameserver (or the system's configured resolvers
+        if none is given) for A and AAAA records of each hostname, and PTR
+        records of each IP.  By default every forward name and every PTR
+        IP we know about is checked.  Queries are spread across a pool of
+        worker threads so many are in flight at once, but no more than
+        rate queries per second are sent in total.  Lookups that time out
+        are retried up to retries more times before being reported.
+        Lookups that can't be made at all (e.g. a malformed name or IP) are
+        reported too, so an incomplete check never looks like a clean one.
+        The problems are returned sorted.
+
+        The nameserver must be given as an IPv4 or IPv6 address, not a
+        hostname - a ValueError is raised otherwise.
+        """
+
+        # IPy also accepts networks and bare integers, so insist on one
+        # dotted or colon-separated address
+        if nameserver is not None:
+            try:
+                is_address = (IP(nameserver).len() == 1 and re.search(r'[.:]', nameserver))
+            except ValueError:
+                is_address = False
+            if not is_address:
+                raise ValueError("nameserver must be an IP address, not '%s'" % nameserver)
+
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+
+        if hostnames is None:
+            hostnames = self.name_to_all_ip_map.keys()
+        if ips is None:
+            ips = self.ptr_record_to_name_map.keys()
+
+        # Build the list of (record type, name or IP) queries to make
+        jobs = Queue.Queue()
+        for hostname in hostnames:
+            hostname = re.sub(r'^\s*(\S+)\s*$', r'\1', hostname.lower())
+
+            # Zone apex records are stored as "@.<zone>", which won't resolve
+            hostname = re.sub(r'^@\.', '', hostname)
+
+            jobs.put(('A', hostname))
+            jobs.put(('AAAA', hostname))
+        for ip in ips:
+            jobs.put(('PTR', re.sub(r'^\s*(\S+)\s*$', r'\1', ip)))
+
+        # Simple shared rate limiter - each query takes the next free
+        # send slot, sleeping until it comes round
+        rate_lock = threading.Lock()
+        next_slot = [time.time()]
+        interval  = 1.0 / rate
+
+        def wait_for_slot():
+            rate_lock.acquire()
+            try:
+                now = time.time()
+                slot = max(now, next_slot[0])
+                next_slot[0] = slot + interval
+            finally:
+                rate_lock.release()
+            if slot > now:
+                time.sleep(slot - now)
+
+        problems = []
+
+        def worker(live):
+            while True:
+                try:
+                    (rdtype, target) = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+
+                try:
+                    problem = self._verify_record(live, rdtype, target, retries, wait_for_slot)
+                except Exception as e:
+                    problem = "Live "+rdtype+" lookup for "+target+" could not be made: "+str(e)
+
+                if problem:
+                    problems.append(problem)
+                jobs.task_done()
+
+        threads = []
+        for i in range(min(workers, jobs.qsize())):
+
+            # Set up each worker's resolver here, so any problem with the
+            # resolver configuration is raised to the caller
+            live = dns.resolver.Resolver(configure=(nameserver is None))
+            if nameserver:
+                live.nameservers = [nameserver]
+            live.port     = port
+            live.timeout  = timeout
+            live.lifetime = timeout
+
+            thread = threading.Thread(target=worker, args=(live,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        return sorted(problems)
+
+    def _verify_record(self, live, rdtype, target, retries, wait_for_slot):
+        """
+        Looks up a single A, AAAA or PTR record using the given resolver,
+        retrying on timeouts, and compares the answer with our zone data.
+        Returns a description of the problem, or None if they match.
+        """
+
+        if rdtype == 'PTR':
+            # Minimise the IP as the zone maps do, so e.g. IPv6 addresses
+            # with leading zeros still match
+            target   = str(IP(target))
+            expected = set(self.ptr_record_to_name_map.get(target, []))
+            qname    = dns.reversename.from_address(target)
+        else:
+            # The resolver follows CNAMEs for us, so compare against every
+            # IP of the right family the name ends up at
+            is_v6    = (rdtype == 'AAAA')
+            all_ips  = list(self.name_to_all_ip_map.get(target, [])) + list(self.name_to_all_ip_map.get('@.'+target, []))
+            expected = set([ip for ip in all_ips if (':' in ip) == is_v6])
+            qname    = dns.name.from_text(target)
+
+        found = None
+        for attempt in range(retries + 1):
+            wait_for_slot()
+            try:
+                answer = live.query(qname, rdtype)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                found = set()
+                break
+            except (dns.exception.Timeout, dns.resolver.NoNameservers):
+                continue
+
+            if rdtype == 'PTR':
+                found = set([re.sub(r'\.$', '', str(rdata.target).lower()) for rdata in answer])
+            else:
+                # Minimise addresses using IPy, as the zone maps do
+                found = set([str(IP(str(rdata.address))) for rdata in answer])
+            break
+
+        if found is None:
+            return "Live "+rdtype+" lookup for "+target+" failed after "+str(retries + 1)+" attempts"
+
+        if found != expected:
+            return "Live "+rdtype+" records for "+target+" ("+','.join(sorted(found))+") differ from zone data ("+','.join(sorted(expected))+")"
+
+        return None
+
 
 
     def lookupByHostname(self, hostname):
@@ -382,15 +799,15 @@ class Domainalyzer:
         # Find any entries we have for the hostname in any of our maps
         a_records = None
         if hostname in self.a_record_to_ip_map:
-            a_records = self.a_record_to_ip_map[hostname]
+            a_records = list(self.a_record_to_ip_map[hostname])
 
         aaaa_records = None
         if hostname in self.aaaa_record_to_ip_map:
-            aaaa_records = self.aaaa_record_to_ip_map[hostname]
+            aaaa_records = list(self.aaaa_record_to_ip_map[hostname])
 
         ip_list = None
         if hostname in self.name_to_all_ip_map:
-            ip_list = self.name_to_all_ip_map[hostname]
+            ip_list = list(self.name_to_all_ip_map[hostname])
 
         cname_to = None
         if hostname in self.forward_cname_map:
@@ -398,17 +815,17 @@ class Domainalyzer:
 
         cname_from_list = None
         if hostname in self.reverse_cname_map:
-            cname_from_list = self.reverse_cname_map[hostname]
+            cname_from_list = list(self.reverse_cname_map[hostname])
 
         ptr_list = None
         if hostname in self.ptr_record_to_name_map:
-            ptr_list = self.ptr_record_to_name_map[hostname]
+            ptr_list = list(self.ptr_record_to_name_map[hostname])
 
         # This is the "CNAME with" list - i.e. if this is a CNAME,
         # what else is CNAMEd to the same real hostname?
         cname_with_list = None
         if cname_to:
-            cname_with_list = self.reverse_cname_map[cname_to]
+            cname_with_list = list(self.reverse_cname_map.get(cname_to, []))
 
         return {
           'A_LIST'         : a_records,
@@ -429,19 +846,19 @@ class Domainalyzer:
 
         a_records = None
         if ip in self.ip_to_a_record_map:
-            a_records = self.ip_to_a_record_map[ip]
+            a_records = list(self.ip_to_a_record_map[ip])
 
         aaaa_records = None
         if ip in self.ip_to_aaaa_record_map:
-            aaaa_records = self.ip_to_aaaa_record_map[ip]
+            aaaa_records = list(self.ip_to_aaaa_record_map[ip])
 
         ptr_records = None
         if ip in self.ptr_record_to_name_map:
-            ptr_records = self.ptr_record_to_name_map[ip]
+            ptr_records = list(self.ptr_record_to_name_map[ip])
 
         name_list = None
         if ip in self.ip_to_all_names_map:
-            name_list = self.ip_to_all_names_map[ip]
+            name_list = list(self.ip_to_all_names_map[ip])
 
         return{
           'A_LIST'    : a_records,
@@ -0,0 +1,26 @@
+"""
+Stand-in for dnspython zone objects, so zones can be mapped without a
+zone transfer.
+"""
+
+
+class FakeRdata:
+    """
+    Record data with whatever attributes (address, target) the mapping
+    code reads.
+    """
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeZone:
+    """
+    Zone built from a dict of record type -> [(name, rdata attributes)].
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    def iterate_rdatas(self, rdtype):
+        return [(name, 300, FakeRdata(**attrs)) for (name, attrs) in self.records.get(rdtype, [])]
@@ -0,0 +1,190 @@
+import socket
+import threading
+import unittest
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.reversename
+import dns.rrset
+
+from domainalyzer import Domainalyzer
+from tests.fakezone import FakeZone
+
+
+FORWARD = FakeZone({
+    'A': [
+        ('@',    {'address': '10.0.0.3'}),
+        ('www',  {'address': '10.0.0.1'}),
+        ('web',  {'address': '10.0.0.2'}),
+        ('gone', {'address': '10.0.0.4'}),
+        ('slow', {'address': '10.0.0.5'}),
+    ],
+    'AAAA': [
+        ('www', {'address': '2001:db8::1'}),
+        ('v6',  {'address': '2001:db8::6'}),
+    ],
+})
+
+REVERSE = FakeZone({
+    'PTR': [
+        ('1', {'target': 'www.ex.com.'}),
+        ('2', {'target': 'web.ex.com.'}),
+        ('4', {'target': 'gone.ex.com.'}),
+    ],
+})
+
+REVERSE_V6 = FakeZone({
+    'PTR': [
+        ('1.0.0.0', {'target': 'www.ex.com.'}),
+    ],
+})
+
+
+class StandInDNSServer:
+    """
+    Minimal UDP DNS responder on 127.0.0.1.  Answers from a dict of
+    (name, type) -> [rdata text], gives an empty answer for other types of
+    a known name, NXDOMAIN for unknown names, and never answers names in
+    the drop set (counting how often they were asked for).
+    """
+
+    def __init__(self, records, drop):
+        self.records  = records
+        self.names    = set([name for (name, rdtype) in records])
+        self.drop     = drop
+        self.attempts = {}
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+
+        self.running = True
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while self.running:
+            try:
+                (wire, addr) = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+
+            query    = dns.message.from_wire(wire)
+            question = query.question[0]
+            name     = str(question.name).lower()
+            rdtype   = dns.rdatatype.to_text(question.rdtype)
+
+            if name in self.drop:
+                self.attempts[(name, rdtype)] = self.attempts.get((name, rdtype), 0) + 1
+                continue
+
+            response = dns.message.make_response(query)
+            if (name, rdtype) in self.records:
+                response.answer.append(dns.rrset.from_text(question.name, 60, 'IN', rdtype, *self.records[(name, rdtype)]))
+            elif name not in self.names:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+
+            self.sock.sendto(response.to_wire(), addr)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+class VerifyLiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = Domainalyzer()
+        self.checker._map_forward_zone(FORWARD, 'ex.com')
+        self.checker._map_reverse_zone(REVERSE, False, '10.0.0', '0.0.10.IN-ADDR.ARPA')
+        self.checker._map_reverse_zone(REVERSE_V6, True, '20010db8' + '0' * 20,
+                                       '0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.8.b.d.0.1.0.0.2.IP6.ARPA')
+
+        self.server = StandInDNSServer({
+            ('ex.com.', 'A'):          ['10.0.0.3'],
+            ('www.ex.com.', 'A'):      ['10.0.0.1'],
+            ('www.ex.com.', 'AAAA'):   ['2001:db8::1'],
+            ('web.ex.com.', 'A'):      ['10.0.0.99'],
+            ('v6.ex.com.', 'AAAA'):    ['2001:db8::7'],
+            ('1.0.0.10.in-addr.arpa.', 'PTR'): ['www.ex.com.'],
+            ('2.0.0.10.in-addr.arpa.', 'PTR'): ['other.ex.com.'],
+            (str(dns.reversename.from_address('2001:db8::1')).lower(), 'PTR'): ['www.ex.com.'],
+        }, drop=set(['slow.ex.com.']))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def verify(self, **kwargs):
+        kwargs.setdefault('hostnames', [])
+        kwargs.setdefault('ips', [])
+        kwargs.setdefault('rate', 1000)
+        kwargs.setdefault('timeout', 0.2)
+        return self.checker.verifyLive('127.0.0.1', port=self.server.port, **kwargs)
+
+    def test_matching_answers(self):
+        self.assertEqual(self.verify(hostnames=['www.ex.com', 'ex.com'], ips=['10.0.0.1', '2001:db8::1']), [])
+
+    def test_differing_a(self):
+        # web.ex.com has no AAAA in the zone or live (NoAnswer), so only the A differs
+        self.assertEqual(self.verify(hostnames=['web.ex.com']), [
+            "Live A records for web.ex.com (10.0.0.99) differ from zone data (10.0.0.2)",
+        ])
+
+    def test_differing_aaaa(self):
+        self.assertEqual(self.verify(hostnames=['v6.ex.com']), [
+            "Live AAAA records for v6.ex.com (2001:db8::7) differ from zone data (2001:db8::6)",
+        ])
+
+    def test_differing_ptr(self):
+        self.assertEqual(self.verify(ips=['10.0.0.2']), [
+            "Live PTR records for 10.0.0.2 (other.ex.com) differ from zone data (web.ex.com)",
+        ])
+
+    def test_nxdomain_is_empty(self):
+        self.assertEqual(self.verify(hostnames=['gone.ex.com'], ips=['10.0.0.4']), [
+            "Live A records for gone.ex.com () differ from zone data (10.0.0.4)",
+            "Live PTR records for 10.0.0.4 () differ from zone data (gone.ex.com)",
+        ])
+
+    def test_ipv6_input_is_normalised(self):
+        self.assertEqual(self.verify(ips=['2001:0db8::0001']), [])
+
+    def test_timeout_is_retried_then_reported(self):
+        self.assertEqual(self.verify(hostnames=['slow.ex.com'], retries=1), [
+            "Live A lookup for slow.ex.com failed after 2 attempts",
+            "Live AAAA lookup for slow.ex.com failed after 2 attempts",
+        ])
+        self.assertTrue(self.server.attempts[('slow.ex.com.', 'A')] >= 2)
+
+    def test_bad_input_does_not_stop_the_check(self):
+        problems = self.verify(ips=['bad', '10.0.0.2'], workers=1)
+
+        self.assertEqual(len(problems), 2)
+        self.assertTrue(problems[0].startswith("Live PTR lookup for bad could not be made: "))
+        self.assertEqual(problems[1], "Live PTR records for 10.0.0.2 (other.ex.com) differ from zone data (web.ex.com)")
+
+    def test_checks_everything_by_default(self):
+        problems = self.checker.verifyLive('127.0.0.1', port=self.server.port, rate=1000, timeout=0.2, retries=0)
+
+        self.assertEqual(problems, sorted(problems))
+        self.assertFalse([problem for problem in problems if '@' in problem])
+        self.assertFalse([problem for problem in problems if 'www.ex.com' in problem])
+        self.assertEqual(len(problems), 7)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, self.verify, rate=0)
+        self.assertRaises(ValueError, self.verify, workers=0)
+
+    def test_nameserver_must_be_an_ip(self):
+        self.assertRaises(ValueError, self.checker.verifyLive, 'resolver.invalid', hostnames=['www.ex.com'], ips=[])
+        self.assertRaises(ValueError, self.checker.verifyLive, '10.0.0.300', hostnames=['www.ex.com'], ips=[])
+        self.assertRaises(ValueError, self.checker.verifyLive, '10.0.0.0/24', hostnames=['www.ex.com'], ips=[])
+        self.assertEqual(self.server.attempts, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
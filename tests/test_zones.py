@@ -0,0 +1,205 @@
+import cPickle
+import time
+import unittest
+
+import dns.exception
+import dns.query
+import dns.zone
+
+from domainalyzer import Domainalyzer
+from tests.fakezone import FakeZone
+
+
+PARENT = FakeZone({
+    'CNAME': [('alias', {'target': 'www.sub'})],
+    'A':     [('mail',  {'address': '10.0.0.1'})],
+})
+
+CHILD = FakeZone({
+    'CNAME': [('web', {'target': 'www'})],
+    'A':     [('www', {'address': '10.0.0.9'})],
+    'AAAA':  [('www', {'address': '2001:0db8::0009'})],
+})
+
+REVERSE = FakeZone({
+    'PTR': [('9', {'target': 'www.sub.ex.com.'})],
+})
+
+
+def snapshot(checker):
+    """
+    Returns the contents of every map in an order-independent form.
+    """
+    maps = {}
+    for attr in ('a_record_to_ip_map', 'ip_to_a_record_map',
+                 'aaaa_record_to_ip_map', 'ip_to_aaaa_record_map',
+                 'ptr_record_to_name_map', 'name_to_ptr_record_map',
+                 'reverse_cname_map', 'ip_to_all_names_map', 'name_to_all_ip_map'):
+        maps[attr] = dict((key, sorted(values)) for (key, values) in getattr(checker, attr).items())
+    maps['forward_cname_map'] = dict(checker.forward_cname_map)
+    maps['known_domains'] = sorted(checker.known_domains)
+    return maps
+
+
+class ZoneTrackingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = Domainalyzer()
+        self.checker._map_forward_zone(PARENT, 'ex.com')
+        self.checker._map_forward_zone(CHILD, 'sub.ex.com')
+        self.checker._map_reverse_zone(REVERSE, False, '10.0.0', '0.0.10.IN-ADDR.ARPA')
+
+        self.transfers = {}
+        self.real_xfr = dns.query.xfr
+        self.real_from_xfr = dns.zone.from_xfr
+        dns.query.xfr = lambda server, zone_name: zone_name
+        dns.zone.from_xfr = self.fake_from_xfr
+
+    def tearDown(self):
+        dns.query.xfr = self.real_xfr
+        dns.zone.from_xfr = self.real_from_xfr
+
+    def fake_from_xfr(self, zone_name, relativize=True):
+        if zone_name not in self.transfers:
+            raise dns.exception.FormError("transfer refused")
+        return self.transfers[zone_name]
+
+    def test_cname_across_zones(self):
+        self.assertEqual(sorted(self.checker.name_to_all_ip_map['alias.ex.com']), ['10.0.0.9', '2001:db8::9'])
+        self.assertEqual(self.checker.findProblems(), [])
+
+    def test_instances_do_not_share_maps(self):
+        self.assertFalse(Domainalyzer().a_record_to_ip_map)
+
+    def test_remove_zone(self):
+        expected = Domainalyzer()
+        expected._map_forward_zone(CHILD, 'sub.ex.com')
+        expected._map_reverse_zone(REVERSE, False, '10.0.0', '0.0.10.IN-ADDR.ARPA')
+
+        self.assertTrue(self.checker.remove_zone('ex.com'))
+        self.assertEqual(snapshot(self.checker), snapshot(expected))
+        self.assertNotIn('alias.ex.com', self.checker.name_to_all_ip_map)
+
+    def test_remove_address_side_of_cname(self):
+        self.checker.remove_zone('sub.ex.com')
+        self.assertNotIn('alias.ex.com', self.checker.name_to_all_ip_map)
+        self.assertEqual(self.checker.forward_cname_map['alias.ex.com'], 'www.sub.ex.com')
+
+    def test_remove_everything(self):
+        for zone_name in ('ex.com', 'sub.ex.com', '0.0.10.IN-ADDR.ARPA'):
+            self.assertTrue(self.checker.remove_zone(zone_name))
+        self.assertEqual(snapshot(self.checker), snapshot(Domainalyzer()))
+        self.assertFalse(self.checker.entry_refcounts)
+        self.assertFalse(self.checker.cname_links)
+
+    def test_remove_unknown_zone(self):
+        self.assertFalse(self.checker.remove_zone('nothere.com'))
+
+    def test_remove_empty_zone(self):
+        self.checker._map_forward_zone(FakeZone({}), 'empty.com')
+        self.assertIn('empty.com', self.checker.known_domains)
+        self.assertTrue(self.checker.remove_zone('empty.com'))
+        self.assertNotIn('empty.com', self.checker.known_domains)
+
+    def test_readd_in_any_order_matches_full_build(self):
+        before = snapshot(self.checker)
+        self.transfers = {'ex.com': PARENT, 'sub.ex.com': CHILD}
+
+        self.assertTrue(self.checker.replace_zone('ns0', 'sub.ex.com'))
+        self.assertTrue(self.checker.replace_zone('ns0', 'ex.com'))
+        self.assertEqual(snapshot(self.checker), before)
+
+        self.checker.remove_zone('sub.ex.com')
+        self.checker.remove_zone('ex.com')
+        self.checker.add_forward_zones('ns0', ['sub.ex.com', 'ex.com'])
+        self.assertEqual(snapshot(self.checker), before)
+
+    def test_replace_changed_zone(self):
+        self.transfers = {'sub.ex.com': FakeZone({'A': [('www', {'address': '10.0.0.10'})]})}
+
+        self.assertTrue(self.checker.replace_zone('ns0', 'sub.ex.com'))
+        self.assertEqual(self.checker.lookupByHostname('alias.ex.com')['IP_LIST'], ['10.0.0.10'])
+        self.assertEqual(self.checker.lookupByHostname('www.sub.ex.com')['A_LIST'], ['10.0.0.10'])
+        self.assertNotIn('web.sub.ex.com', self.checker.forward_cname_map)
+        self.assertNotIn('10.0.0.9', self.checker.ip_to_all_names_map)
+
+    def test_replace_reverse_zone(self):
+        self.transfers = {'0.0.10.IN-ADDR.ARPA': FakeZone({'PTR': [('1', {'target': 'mail.ex.com.'})]})}
+
+        self.assertTrue(self.checker.replace_zone('ns0', '0.0.10.IN-ADDR.ARPA'))
+        self.assertEqual(snapshot(self.checker)['ptr_record_to_name_map'], {'10.0.0.1': ['mail.ex.com']})
+
+    def test_conflicting_cname_restored(self):
+        # Parent zone also has web.sub, which the child zone calls web
+        parent = FakeZone({
+            'CNAME': [('alias', {'target': 'www.sub'}), ('web.sub', {'target': 'mail'})],
+            'A':     [('mail',  {'address': '10.0.0.1'})],
+        })
+        self.checker.remove_zone('ex.com')
+        self.checker._map_forward_zone(parent, 'ex.com')
+        self.assertEqual(self.checker.forward_cname_map['web.sub.ex.com'], 'mail.ex.com')
+
+        self.checker.remove_zone('ex.com')
+        self.assertEqual(self.checker.forward_cname_map['web.sub.ex.com'], 'www.sub.ex.com')
+
+        self.checker._map_forward_zone(parent, 'ex.com')
+        self.checker.remove_zone('sub.ex.com')
+        self.assertEqual(self.checker.forward_cname_map['web.sub.ex.com'], 'mail.ex.com')
+
+        self.checker.remove_zone('ex.com')
+        self.assertNotIn('web.sub.ex.com', self.checker.forward_cname_map)
+        self.assertFalse(self.checker.forward_cname_targets)
+
+    def test_remove_shared_ip_is_linear(self):
+        def time_remove(count):
+            checker = Domainalyzer()
+            zone = FakeZone({'A': [('host%d' % i, {'address': '10.0.0.1'}) for i in range(count)]})
+
+            start = time.time()
+            checker._map_forward_zone(zone, 'big.com')
+            added = time.time() - start
+
+            start = time.time()
+            checker.remove_zone('big.com')
+            removed = time.time() - start
+
+            self.assertFalse(checker.ip_to_a_record_map)
+            return (added, removed)
+
+        # Every host shares one IP, so a per-key list scan would make
+        # removal quadratic - it should cost about the same as adding
+        (added, removed) = time_remove(20000)
+        self.assertTrue(removed < 3 * added, "adding took %.2fs, removing %.2fs" % (added, removed))
+
+    def test_lookups_return_lists(self):
+        found = self.checker.lookupByIP('10.0.0.9')
+        self.assertEqual(found['A_LIST'], ['www.sub.ex.com'])
+        self.assertEqual(type(found['NAME_LIST']), list)
+
+    def test_replace_failed_transfer_keeps_old_copy(self):
+        before = snapshot(self.checker)
+        self.assertFalse(self.checker.replace_zone('ns0', 'sub.ex.com'))
+        self.assertEqual(snapshot(self.checker), before)
+
+    def test_pickle_round_trip(self):
+        state = self.checker.__getstate__()
+        self.assertEqual(state[0]['www.sub.ex.com'], ['10.0.0.9'])
+        self.assertEqual(type(state[0]['www.sub.ex.com']), list)
+
+        loaded = cPickle.loads(cPickle.dumps(self.checker))
+        self.assertEqual(snapshot(loaded), snapshot(self.checker))
+        self.assertTrue(loaded.remove_zone('ex.com'))
+        self.assertNotIn('alias.ex.com', loaded.name_to_all_ip_map)
+
+    def test_old_pickle_refuses_zone_changes(self):
+        # Old pickles only held the first 12 items of state
+        loaded = Domainalyzer()
+        loaded.__setstate__(self.checker.__getstate__()[:12])
+
+        self.assertEqual(loaded.lookupByIP('10.0.0.9')['A_LIST'], ['www.sub.ex.com'])
+        self.assertRaises(RuntimeError, loaded.remove_zone, 'ex.com')
+        self.assertRaises(RuntimeError, loaded.replace_zone, 'ns0', 'ex.com')
+
+
+if __name__ == '__main__':
+    unittest.main()